@@ -1,7 +1,6 @@
 import streamlit as st
 from elasticsearch import Elasticsearch
-from sentence_transformers import SentenceTransformer
-import time
+import embedding
 
 st.set_page_config(
     page_title="Amazon Kids Product Search",
@@ -18,137 +17,251 @@ except:
     st.error("⚠️ Please configure secrets in Streamlit Cloud dashboard")
     st.stop()
 
-INDEX_NAME = "amazon_2020_bbq"
+INDEX_NAME = st.secrets.get("INDEX_NAME", "amazon_2020_bbq")
+
+# kNN breadth, tuned offline with calibrate_num_candidates.py
+NUM_CANDIDATES = int(st.secrets.get("NUM_CANDIDATES", 100))
+RRF_KNN_K = 50
+RRF_NUM_CANDIDATES = int(st.secrets.get("RRF_NUM_CANDIDATES", 100))
+# Fusion and rerank depth; these trade relevance (and reranker cost), not kNN recall, so the
+# calibration script doesn't pick them; tune them by judging result quality instead
+RRF_RANK_WINDOW_SIZE = int(st.secrets.get("RRF_RANK_WINDOW_SIZE", 100))
+RERANK_WINDOW_SIZE = int(st.secrets.get("RERANK_WINDOW_SIZE", 50))
+# The reranker reorders the pipeline's top 50 anyway, so its kNN arm only needs a thin margin over k;
+# capped by the hybrid arm's value so the pipeline is never wider than plain hybrid
+PIPELINE_NUM_CANDIDATES = min(60, max(RRF_NUM_CANDIDATES, RRF_KNN_K))
+
+# The UI only reads took, _source and _score; drop shard info, _id, _index etc. from responses
+FILTER_PATH = ["took", "hits.hits._source", "hits.hits._score"]
+MSEARCH_FILTER_PATH = ["responses.error.type"] + [f"responses.{p}" for p in FILTER_PATH]
+
+examples = [
+    "Hot Wheels race track",
+    "Barbie dolls",
+    "LEGO Star Wars",
+    "educational STEM toys",
+    "coloring books",
+    "Pokemon plush",
+    "board games family",
+    "outdoor sports toys"
+]
 
 # Initialize connections
 @st.cache_resource
 def init_elasticsearch():
-    return Elasticsearch(
+    es = Elasticsearch(
         cloud_id=CLOUD_ID,
-        basic_auth=(USERNAME, PASSWORD)
+        basic_auth=(USERNAME, PASSWORD),
+        http_compress=True,
+        request_timeout=10,
+        max_retries=1,
+        retry_on_timeout=False,
+        node_class="urllib3",
+        connections_per_node=10,
+        headers={"Connection": "keep-alive"}
     )
+    # Open the first pooled connection now so the first search skips the TLS handshake.
+    # ping() returns False instead of raising, so a failed warm-up never stops the app.
+    es.ping()
+    return es
 
 @st.cache_resource
 def init_model():
-    return SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+    return embedding.load_model()
+
+def encode(texts):
+    return embedding.encode(tokenizer, model, texts)
+
+@st.cache_resource
+def warmup_embeddings():
+    # One query per forward pass: the int8 model's dynamic activation scale spans the whole batch,
+    # so batching would give these vectors different values from a later solo encode of the same text
+    return {q: encode([q])[0].tolist() for q in examples}
 
 client = init_elasticsearch()
-model = init_model()
+tokenizer, model = init_model()
+PRECOMPUTED = warmup_embeddings()
 
-# Search functions
-def bm25_search(query, k=10):
-    response = client.search(
-        index=INDEX_NAME,
-        body={
-            "size": k,
-            "query": {
-                "multi_match": {
-                    "query": query,
-                    "fields": ["product_name^3", "brand^2", "category^1.5", "document_text"],
-                    "type": "best_fields"
-                }
-            },
-            "_source": ["product_name", "brand", "price", "category", "image_url"]
-        }
-    )
-    return response["hits"]["hits"]
-
-def vector_search(query, k=10):
-    query_vector = model.encode(query).tolist()
-    response = client.search(
-        index=INDEX_NAME,
-        body={
-            "size": k,
-            "knn": {
-                "field": "embedding",
-                "query_vector": query_vector,
-                "k": k,
-                "num_candidates": 100
-            },
-            "_source": ["product_name", "brand", "price", "category", "image_url"]
+@st.cache_data(max_entries=1024, ttl=3600, show_spinner=False)
+def encode_query(query):
+    if query in PRECOMPUTED:
+        return PRECOMPUTED[query]
+    return encode([query])[0].tolist()
+
+# Query body templates, built once. The per-request fields (query, vector, size, candidates)
+# are filled in by shallow-copying only the dicts on the path to them; everything else is shared.
+SOURCE_FIELDS = ["product_name", "brand", "price", "category", "image_url"]
+TEXT_FIELDS = ["product_name^3", "brand^2", "category^1.5", "document_text"]
+
+BM25_BODY_TEMPLATE = {
+    "size": None,
+    "query": {
+        "multi_match": {
+            "query": None,
+            "fields": TEXT_FIELDS,
+            "type": "best_fields"
         }
-    )
-    return response["hits"]["hits"]
-
-def hybrid_rrf_search(query, k=10):
-    query_vector = model.encode(query).tolist()
-    response = client.search(
-        index=INDEX_NAME,
-        body={
-            "size": k,
-            "retriever": {
-                "rrf": {
-                    "retrievers": [
-                        {
-                            "standard": {
-                                "query": {
-                                    "multi_match": {
-                                        "query": query,
-                                        "fields": ["product_name^3", "brand^2", "category^1.5", "document_text"]
-                                    }
-                                }
-                            }
-                        },
-                        {
-                            "knn": {
-                                "field": "embedding",
-                                "query_vector": query_vector,
-                                "k": 50,
-                                "num_candidates": 100
+    },
+    "_source": SOURCE_FIELDS
+}
+
+VEC_BODY_TEMPLATE = {
+    "size": None,
+    "knn": {
+        "field": "embedding",
+        "query_vector": None,
+        "k": None,
+        "num_candidates": None
+    },
+    "_source": SOURCE_FIELDS
+}
+
+HYBRID_BODY_TEMPLATE = {
+    "size": None,
+    "retriever": {
+        "rrf": {
+            "retrievers": [
+                {
+                    "standard": {
+                        "query": {
+                            "multi_match": {
+                                "query": None,
+                                "fields": TEXT_FIELDS
                             }
                         }
-                    ],
-                    "rank_window_size": 100
+                    }
+                },
+                {
+                    "knn": {
+                        "field": "embedding",
+                        "query_vector": None,
+                        "k": RRF_KNN_K,
+                        "num_candidates": None
+                    }
                 }
-            },
-            "_source": ["product_name", "brand", "price", "category", "image_url"]
+            ],
+            "rank_window_size": RRF_RANK_WINDOW_SIZE
         }
-    )
-    return response["hits"]["hits"]
-
-def full_pipeline_search(query, k=10):
-    query_vector = model.encode(query).tolist()
-    response = client.search(
-        index=INDEX_NAME,
-        body={
-            "size": k,
-            "retriever": {
-                "text_similarity_reranker": {
-                    "retriever": {
-                        "rrf": {
-                            "retrievers": [
-                                {
-                                    "standard": {
-                                        "query": {
-                                            "multi_match": {
-                                                "query": query,
-                                                "fields": ["product_name^3", "brand^2", "category^1.5", "document_text"]
-                                            }
-                                        }
-                                    }
-                                },
-                                {
-                                    "knn": {
-                                        "field": "embedding",
-                                        "query_vector": query_vector,
-                                        "k": 50,
-                                        "num_candidates": 100
-                                    }
-                                }
-                            ],
-                            "rank_window_size": 100
-                        }
-                    },
-                    "field": "document_text",
-                    "inference_id": "jina_reranker_v3",
-                    "inference_text": query,
-                    "rank_window_size": 50
-                }
-            },
-            "_source": ["product_name", "brand", "price", "category", "image_url"]
+    },
+    "_source": SOURCE_FIELDS
+}
+
+PIPELINE_BODY_TEMPLATE = {
+    "size": None,
+    "retriever": {
+        "text_similarity_reranker": {
+            "retriever": HYBRID_BODY_TEMPLATE["retriever"],
+            "field": "document_text",
+            "inference_id": "jina_reranker_v3",
+            "inference_text": None,
+            "rank_window_size": RERANK_WINDOW_SIZE
         }
-    )
-    return response["hits"]["hits"]
+    },
+    "_source": SOURCE_FIELDS
+}
+
+RRF_TEMPLATE = HYBRID_BODY_TEMPLATE["retriever"]["rrf"]
+RRF_TEXT_TEMPLATE = RRF_TEMPLATE["retrievers"][0]["standard"]["query"]["multi_match"]
+RRF_KNN_TEMPLATE = RRF_TEMPLATE["retrievers"][1]["knn"]
+RERANKER_TEMPLATE = PIPELINE_BODY_TEMPLATE["retriever"]["text_similarity_reranker"]
+
+def rrf_retriever(query, query_vector, num_candidates):
+    text = RRF_TEXT_TEMPLATE.copy()
+    text["query"] = query
+    knn = RRF_KNN_TEMPLATE.copy()
+    knn["query_vector"] = query_vector
+    knn["num_candidates"] = num_candidates
+    rrf = RRF_TEMPLATE.copy()
+    rrf["retrievers"] = [{"standard": {"query": {"multi_match": text}}}, {"knn": knn}]
+    return {"rrf": rrf}
+
+def bm25_body(query, k=10):
+    match = BM25_BODY_TEMPLATE["query"]["multi_match"].copy()
+    match["query"] = query
+    body = BM25_BODY_TEMPLATE.copy()
+    body["size"] = k
+    body["query"] = {"multi_match": match}
+    return body
+
+def vector_body(query, k=10, query_vector=None):
+    if query_vector is None:
+        query_vector = encode_query(query)
+    knn = VEC_BODY_TEMPLATE["knn"].copy()
+    knn["query_vector"] = query_vector
+    knn["k"] = k
+    knn["num_candidates"] = max(NUM_CANDIDATES, k)
+    body = VEC_BODY_TEMPLATE.copy()
+    body["size"] = k
+    body["knn"] = knn
+    return body
+
+def hybrid_rrf_body(query, k=10, query_vector=None):
+    if query_vector is None:
+        query_vector = encode_query(query)
+    body = HYBRID_BODY_TEMPLATE.copy()
+    body["size"] = k
+    body["retriever"] = rrf_retriever(query, query_vector, max(RRF_NUM_CANDIDATES, RRF_KNN_K))
+    return body
+
+def full_pipeline_body(query, k=10, query_vector=None):
+    if query_vector is None:
+        query_vector = encode_query(query)
+    reranker = RERANKER_TEMPLATE.copy()
+    reranker["retriever"] = rrf_retriever(query, query_vector, PIPELINE_NUM_CANDIDATES)
+    reranker["inference_text"] = query
+    body = PIPELINE_BODY_TEMPLATE.copy()
+    body["size"] = k
+    body["retriever"] = {"text_similarity_reranker": reranker}
+    return body
+
+# Search functions return (hits, took): "took" is the server-side search time, so the latency
+# shown for a cached result is the search's own, not the cache lookup's
+def run_search(body):
+    response = client.search(index=INDEX_NAME, body=body, filter_path=FILTER_PATH)
+    return response.get("hits", {}).get("hits", []), response["took"]
+
+@st.cache_data(ttl=300, max_entries=256, show_spinner=False)
+def bm25_search(query, k=10):
+    return run_search(bm25_body(query, k))
+
+@st.cache_data(ttl=300, max_entries=256, show_spinner=False)
+def vector_search(query, k=10, query_vector=None):
+    return run_search(vector_body(query, k, query_vector))
+
+@st.cache_data(ttl=300, max_entries=256, show_spinner=False)
+def hybrid_rrf_search(query, k=10, query_vector=None):
+    return run_search(hybrid_rrf_body(query, k, query_vector))
+
+@st.cache_data(ttl=300, max_entries=256, show_spinner=False)
+def full_pipeline_search(query, k=10, query_vector=None):
+    return run_search(full_pipeline_body(query, k, query_vector))
+
+class MultiSearchError(Exception):
+    """Raised out of the cached msearch so per-query errors are never cached."""
+
+    def __init__(self, responses):
+        super().__init__("msearch returned errors")
+        self.responses = responses
+
+@st.cache_data(ttl=300, max_entries=256, show_spinner=False)
+def cached_multi_search(bodies):
+    searches = []
+    for body in bodies:
+        searches.extend([{"index": INDEX_NAME}, body])
+    responses = client.msearch(searches=searches, filter_path=MSEARCH_FILTER_PATH)["responses"]
+    # _msearch reports per-query failures (e.g. a reranker timeout) as data; st.cache_data
+    # doesn't store results when the function raises, so a transient error isn't pinned for 5 minutes
+    if any("error" in response for response in responses):
+        raise MultiSearchError(responses)
+    return responses
+
+def multi_search(bodies):
+    try:
+        return cached_multi_search(bodies)
+    except MultiSearchError as e:
+        return e.responses
+
+VECTOR_METHODS = {"Full Pipeline", "Hybrid RRF", "Vector Semantic"}
 
 # UI
 st.title("🎨 Amazon Kids Product Search")
@@ -171,17 +284,6 @@ num_results = st.sidebar.slider("Results", 3, 12, 5)
 
 st.sidebar.markdown("---")
 st.sidebar.markdown("**💡 Try these:**")
-examples = [
-    "Hot Wheels race track",
-    "Barbie dolls",
-    "LEGO Star Wars",
-    "educational STEM toys",
-    "coloring books",
-    "Pokemon plush",
-    "board games family",
-    "outdoor sports toys"
-]
-
 for ex in examples:
     if st.sidebar.button(ex, key=ex):
         st.session_state["query"] = ex
@@ -191,57 +293,47 @@ query = st.text_input(
     "Search for kids products:",
     value=st.session_state.get("query", ""),
     placeholder="e.g., LEGO sets, educational toys, board games..."
-)
+).strip()
+
+# Last (method, query, k) and its results for this session: a rerun with unchanged inputs
+# (e.g. an unrelated widget click) reuses them with one comparison instead of a cache dispatch
+st.session_state.setdefault("last_query", None)
+st.session_state.setdefault("last_results", None)
 
 # Comparison mode
 if comparison_mode and query:
     st.markdown("### 🔬 Method Comparison")
     
-    col1, col2, col3, col4 = st.columns(4)
-    
-    with col1:
-        st.markdown("**📝 BM25**")
-        start = time.time()
-        bm25_res = bm25_search(query, k=num_results)
-        bm25_time = (time.time() - start) * 1000
-        st.metric("Latency", f"{bm25_time:.0f}ms")
-        for i, hit in enumerate(bm25_res, 1):
-            s = hit["_source"]
-            st.markdown(f"**{i}.** {s['product_name'][:40]}...")
-            st.caption(f"${s.get('price', 0):.2f}")
-    
-    with col2:
-        st.markdown("**🧠 Vector**")
-        start = time.time()
-        vec_res = vector_search(query, k=num_results)
-        vec_time = (time.time() - start) * 1000
-        st.metric("Latency", f"{vec_time:.0f}ms")
-        for i, hit in enumerate(vec_res, 1):
-            s = hit["_source"]
-            st.markdown(f"**{i}.** {s['product_name'][:40]}...")
-            st.caption(f"${s.get('price', 0):.2f}")
-    
-    with col3:
-        st.markdown("**🔀 Hybrid**")
-        start = time.time()
-        hyb_res = hybrid_rrf_search(query, k=num_results)
-        hyb_time = (time.time() - start) * 1000
-        st.metric("Latency", f"{hyb_time:.0f}ms")
-        for i, hit in enumerate(hyb_res, 1):
-            s = hit["_source"]
-            st.markdown(f"**{i}.** {s['product_name'][:40]}...")
-            st.caption(f"${s.get('price', 0):.2f}")
+    labels = ["**📝 BM25**", "**🧠 Vector**", "**🔀 Hybrid**", "**🚀 Pipeline**"]
+    key = ("Compare", query, num_results)
+    responses = st.session_state["last_results"] if st.session_state["last_query"] == key else None
+    if responses is None:
+        # One embedding shared by every vector-based method
+        qv = encode_query(query)
+        bodies = [
+            bm25_body(query, k=num_results),
+            vector_body(query, k=num_results, query_vector=qv),
+            hybrid_rrf_body(query, k=num_results, query_vector=qv),
+            full_pipeline_body(query, k=num_results, query_vector=qv)
+        ]
+        # All four queries in a single _msearch round-trip; latency is the server-side "took"
+        responses = multi_search(bodies)
+        # Keep failed searches (e.g. a reranker error) out of the session so the next rerun retries
+        if not any("error" in response for response in responses):
+            st.session_state["last_query"] = key
+            st.session_state["last_results"] = responses
     
-    with col4:
-        st.markdown("**🚀 Pipeline**")
-        start = time.time()
-        pip_res = full_pipeline_search(query, k=num_results)
-        pip_time = (time.time() - start) * 1000
-        st.metric("Latency", f"{pip_time:.0f}ms")
-        for i, hit in enumerate(pip_res, 1):
-            s = hit["_source"]
-            st.markdown(f"**{i}.** {s['product_name'][:40]}...")
-            st.caption(f"${s.get('price', 0):.2f}")
+    for col, label, response in zip(st.columns(4), labels, responses):
+        with col:
+            st.markdown(label)
+            if "error" in response:
+                st.error(response["error"].get("type", "search failed"))
+                continue
+            st.metric("Latency", f"{response['took']:.0f}ms")
+            for i, hit in enumerate(response.get("hits", {}).get("hits", []), 1):
+                s = hit["_source"]
+                st.markdown(f"**{i}.** {s['product_name'][:40]}...")
+                st.caption(f"${s.get('price', 0):.2f}")
     
     st.markdown("---")
     st.success("💡 Full Pipeline reranks for maximum relevance!")
@@ -256,12 +348,21 @@ elif not comparison_mode and query and search_method:
     }
     
     with st.spinner(f"Searching..."):
-        start = time.time()
-        results = funcs[search_method](query, k=num_results)
-        latency = (time.time() - start) * 1000
+        key = (search_method, query, num_results)
+        outcome = st.session_state["last_results"] if st.session_state["last_query"] == key else None
+        if outcome is None:
+            # Only the vector-based methods need an embedding; BM25 never touches the encoder
+            if search_method in VECTOR_METHODS:
+                query_vector = encode_query(query)
+                outcome = funcs[search_method](query, k=num_results, query_vector=query_vector)
+            else:
+                outcome = funcs[search_method](query, k=num_results)
+            st.session_state["last_query"] = key
+            st.session_state["last_results"] = outcome
+        results, took = outcome
     
     col1, col2, col3, col4 = st.columns(4)
-    col1.metric("⏱️ Latency", f"{latency:.0f}ms")
+    col1.metric("⏱️ Latency", f"{took:.0f}ms")
     col2.metric("📊 Results", len(results))
     col3.metric("🔧 Method", search_method)
     col4.metric("🎯 Storage", "BBQ int8")
@@ -275,6 +376,7 @@ elif not comparison_mode and query and search_method:
             col_img, col_info = st.columns([1, 4])
             
             with col_img:
+                # st.image passes http URLs straight to the browser, which loads thumbnails in parallel
                 img = s.get("image_url", "")
                 if img and img.startswith("http"):
                     try:
@@ -0,0 +1,87 @@
+"""
+One-off calibration: find the smallest kNN num_candidates that keeps recall@k
+close to an exhaustive-ish baseline (num_candidates=500).
+
+For each query the top-k hits at num_candidates=500 are treated as the gold set,
+and every candidate value in the sweep is scored against it. Two sweeps run:
+k=10 for the plain vector search and k=50 for the kNN arm of the RRF retrievers.
+
+Usage:
+    CLOUD_ID=... USERNAME=... PASSWORD=... python calibrate_num_candidates.py
+Then set NUM_CANDIDATES and RRF_NUM_CANDIDATES in the Streamlit secrets to the
+printed values.
+"""
+import os
+
+from elasticsearch import Elasticsearch
+
+import embedding
+
+INDEX_NAME = os.environ.get("INDEX_NAME", "amazon_2020_bbq")
+GOLD_CANDIDATES = 500
+# (secret name, kNN k, num_candidates values to try)
+SWEEPS = [
+    ("NUM_CANDIDATES", 10, [20, 40, 60, 80, 100]),
+    ("RRF_NUM_CANDIDATES", 50, [60, 80, 100, 150, 200])
+]
+TARGET_RECALL = 0.97
+
+queries = [
+    "Hot Wheels race track",
+    "Barbie dolls",
+    "LEGO Star Wars",
+    "educational STEM toys",
+    "coloring books",
+    "Pokemon plush",
+    "board games family",
+    "outdoor sports toys",
+    "plush toy",
+    "kids toys educational",
+    "lego",
+    "puzzle for toddlers",
+    "remote control car",
+    "art supplies for kids",
+    "baby bath toys",
+    "nerf blaster"
+]
+
+client = Elasticsearch(
+    cloud_id=os.environ["CLOUD_ID"],
+    basic_auth=(os.environ["USERNAME"], os.environ["PASSWORD"]),
+    request_timeout=120
+)
+# Same int8 ONNX encoder the app uses, so recall is measured on the vectors actually sent
+tokenizer, model = embedding.load_model()
+vectors = embedding.encode(tokenizer, model, queries)
+
+def knn_ids(query_vector, k, num_candidates):
+    response = client.search(
+        index=INDEX_NAME,
+        knn={
+            "field": "embedding",
+            "query_vector": query_vector,
+            "k": k,
+            "num_candidates": num_candidates
+        },
+        size=k,
+        source=False
+    )
+    return [hit["_id"] for hit in response["hits"]["hits"]]
+
+for secret, k, sweep in SWEEPS:
+    gold = [set(knn_ids(v.tolist(), k, GOLD_CANDIDATES)) for v in vectors]
+
+    chosen = None
+    for num_candidates in sweep:
+        recalls = []
+        for v, expected in zip(vectors, gold):
+            found = set(knn_ids(v.tolist(), k, num_candidates))
+            recalls.append(len(found & expected) / max(len(expected), 1))
+        recall = sum(recalls) / len(recalls)
+        print(f"k={k} num_candidates={num_candidates}: recall@{k}={recall:.3f}")
+        if chosen is None and recall >= TARGET_RECALL:
+            chosen = num_candidates
+
+    if chosen is None:
+        chosen = sweep[-1]
+    print(f"✅ Recommended {secret} = {chosen}\n")
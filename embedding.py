@@ -0,0 +1,53 @@
+"""
+Query encoder shared by the app and the offline scripts: all-MiniLM-L6-v2
+exported to ONNX and dynamically quantized to int8.
+"""
+import os
+
+import numpy as np
+import onnxruntime as ort
+from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+from transformers import AutoTokenizer
+
+MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+# Anchored to this file so the app and scripts share one export regardless of the working directory
+ONNX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx-minilm-int8")
+
+
+def load_model():
+    # Export MiniLM to ONNX and quantize to int8 once; later starts load the cached files.
+    # Check the files themselves so a start that died mid-export is redone rather than loaded.
+    exported = all(
+        os.path.isfile(os.path.join(ONNX_DIR, name))
+        for name in ["model_quantized.onnx", "config.json", "tokenizer_config.json", "tokenizer.json"]
+    )
+    if not exported:
+        onnx_model = ORTModelForFeatureExtraction.from_pretrained(MODEL_ID, export=True, provider="CPUExecutionProvider")
+        quantizer = ORTQuantizer.from_pretrained(onnx_model)
+        quantizer.quantize(
+            save_dir=ONNX_DIR,
+            quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+        )
+        AutoTokenizer.from_pretrained(MODEL_ID).save_pretrained(ONNX_DIR)
+    # Few intra-op threads per encode so concurrent sessions don't oversubscribe the CPU
+    session_options = ort.SessionOptions()
+    session_options.intra_op_num_threads = 2
+    session_options.inter_op_num_threads = 1
+    tokenizer = AutoTokenizer.from_pretrained(ONNX_DIR)
+    model = ORTModelForFeatureExtraction.from_pretrained(
+        ONNX_DIR,
+        file_name="model_quantized.onnx",
+        provider="CPUExecutionProvider",
+        session_options=session_options
+    )
+    return tokenizer, model
+
+
+def encode(tokenizer, model, texts):
+    # Mean pooling + L2 normalization, matching the sentence-transformers MiniLM pipeline
+    inputs = tokenizer(texts, padding=True, truncation=True, max_length=256, return_tensors="np")
+    hidden = model(**inputs).last_hidden_state
+    mask = inputs["attention_mask"][..., None]
+    pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+    return pooled / np.linalg.norm(pooled, axis=1, keepdims=True)
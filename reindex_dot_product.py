@@ -0,0 +1,51 @@
+"""
+One-off migration: copy the BBQ index into a new index whose embedding field
+uses dot_product similarity instead of cosine.
+
+MiniLM embeddings are unit-length (the app L2-normalizes query vectors too), so
+dot_product ranks identically to cosine while skipping the per-candidate
+magnitude computation during HNSW traversal.
+
+Usage:
+    CLOUD_ID=... USERNAME=... PASSWORD=... python reindex_dot_product.py
+Then set INDEX_NAME = "amazon_2020_bbq_dot" in the Streamlit secrets.
+"""
+import os
+
+from elasticsearch import Elasticsearch
+
+SOURCE_INDEX = "amazon_2020_bbq"
+DEST_INDEX = "amazon_2020_bbq_dot"
+
+client = Elasticsearch(
+    cloud_id=os.environ["CLOUD_ID"],
+    basic_auth=(os.environ["USERNAME"], os.environ["PASSWORD"]),
+    request_timeout=600
+)
+
+# indices.get keys the response by concrete index name, which differs from SOURCE_INDEX if it is an alias
+(source,) = client.indices.get(index=SOURCE_INDEX).values()
+mappings = source["mappings"]
+mappings["properties"]["embedding"]["similarity"] = "dot_product"
+
+# Carry over the analyzers the BM25 fields rely on and the shard layout; read-only settings
+# such as uuid, creation_date, version and provided_name are left behind
+source_settings = source["settings"]["index"]
+settings = {
+    key: source_settings[key]
+    for key in ["analysis", "number_of_shards", "number_of_replicas"]
+    if key in source_settings
+}
+
+if client.indices.exists(index=DEST_INDEX):
+    print(f"⚠️ {DEST_INDEX} already exists, delete it first to rebuild")
+else:
+    client.indices.create(index=DEST_INDEX, settings=settings, mappings=mappings)
+    result = client.reindex(
+        source={"index": SOURCE_INDEX},
+        dest={"index": DEST_INDEX},
+        wait_for_completion=True
+    )
+    print(f"✅ Reindexed {result['created']:,} documents into {DEST_INDEX}")
+    if result["failures"]:
+        print(f"❌ {len(result['failures'])} failures, first: {result['failures'][0]}")